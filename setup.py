@@ -65,7 +65,10 @@ if __name__ == "__main__":
         zip_safe=False,
         classifiers=CLASSIFIERS,
         install_requires=INSTALL_REQUIRES,
-        extras_require={"test": ["pytest"]},
+        extras_require={
+            "parquet": ["pyarrow >= 6.0.0"],
+            "test": ["pytest"],
+        },
         options={},
         include_package_data=True,
     )
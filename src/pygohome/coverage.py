@@ -0,0 +1,126 @@
+"""Data for the map layers showing what the world is made of."""
+
+from typing import Optional, Tuple
+
+import networkx as nx
+import numpy as np
+import pandas as pd
+
+COLUMNS = ["src_latitude", "src_longitude", "dst_latitude", "dst_longitude"]
+
+
+def cell_size(zoom: int, pixels: int) -> float:
+    """Return the width in degrees of `pixels` map pixels at the zoom."""
+    return 360 * pixels / (256 * 2**zoom)
+
+
+def edge_coverage(graph: nx.DiGraph) -> pd.DataFrame:
+    """Return the coordinates, traversal count and median secs of edges.
+
+    Edges within a single slow intersection are left out.
+    """
+    nodes = list(graph.nodes)
+    index = {node: num for num, node in enumerate(nodes)}
+    latitude = np.array([graph.nodes[node]["latitude"] for node in nodes])
+    longitude = np.array([graph.nodes[node]["longitude"] for node in nodes])
+
+    edges = list(graph.edges(data="secs"))
+    src = np.array([index[u] for u, _, _ in edges], dtype=int)
+    dst = np.array([index[v] for _, v, _ in edges], dtype=int)
+    counts = np.array([len(secs) for _, _, secs in edges], dtype=int)
+
+    # `secs` are sorted, the median is in the middle of each edge's slice
+    flat = np.concatenate([np.zeros(0)] + [secs for _, _, secs in edges])
+    starts = np.cumsum(counts) - counts
+    median = (
+        flat[starts + (counts - 1) // 2] + flat[starts + counts // 2]
+    ) / 2
+
+    dfr = pd.DataFrame(
+        {
+            "src_latitude": latitude[src],
+            "src_longitude": longitude[src],
+            "dst_latitude": latitude[dst],
+            "dst_longitude": longitude[dst],
+            "count": counts,
+            "median": median,
+        }
+    )
+    is_inner = (dfr["src_latitude"] == dfr["dst_latitude"]) & (
+        dfr["src_longitude"] == dfr["dst_longitude"]
+    )
+    return dfr[~is_inner].reset_index(drop=True)
+
+
+def simplify_edges(
+    dfr_edges: pd.DataFrame,
+    zoom: int,
+    pixels: int = 4,
+    bounds: Optional[Tuple[Tuple[float, float], Tuple[float, float]]] = None,
+) -> pd.DataFrame:
+    """Merge edges with endpoints in the same cells of the zoom level.
+
+    Edges shorter than a cell are dropped, parallel edges are merged
+    summing their counts and averaging their medians. With the
+    ((south, west), (north, east)) bounds, only the edges whose bounding
+    box overlaps them are kept.
+    """
+    if bounds is not None:
+        (south, west), (north, east) = bounds
+        lat = dfr_edges[["src_latitude", "dst_latitude"]]
+        lon = dfr_edges[["src_longitude", "dst_longitude"]]
+        is_inside = (lat.max(axis=1) >= south) & (lat.min(axis=1) <= north)
+        is_inside &= (lon.max(axis=1) >= west) & (lon.min(axis=1) <= east)
+        dfr_edges = dfr_edges[is_inside]
+    cell = cell_size(zoom, pixels)
+    snapped = (dfr_edges[COLUMNS] // cell).astype(int)
+    is_long = (snapped["src_latitude"] != snapped["dst_latitude"]) | (
+        snapped["src_longitude"] != snapped["dst_longitude"]
+    )
+    dfr = (snapped[is_long] + 0.5) * cell
+    dfr["count"] = dfr_edges["count"]
+    dfr["median"] = dfr_edges["median"]
+    return (
+        dfr.groupby(COLUMNS)
+        .agg(count=("count", "sum"), median=("median", "mean"))
+        .reset_index()
+    )
+
+
+def heat_points(
+    latitude: np.ndarray,
+    longitude: np.ndarray,
+    zoom: int,
+    pixels: int = 8,
+    bounds: Optional[Tuple[Tuple[float, float], Tuple[float, float]]] = None,
+) -> np.ndarray:
+    """Count the points in the cells of the zoom level.
+
+    Return rows of latitude, longitude and the relative weight (max 1.0)
+    of every non-empty cell within the ((south, west), (north, east))
+    bounds.
+    """
+    if bounds is not None:
+        (south, west), (north, east) = bounds
+        is_inside = (south <= latitude) & (latitude <= north)
+        is_inside &= (west <= longitude) & (longitude <= east)
+        latitude, longitude = latitude[is_inside], longitude[is_inside]
+    if not len(latitude):
+        return np.zeros((0, 3))
+    cell = cell_size(zoom, pixels)
+    cells, counts = np.unique(
+        np.floor(np.column_stack([latitude, longitude]) / cell).astype(int),
+        axis=0,
+        return_counts=True,
+    )
+    return np.column_stack([(cells + 0.5) * cell, counts / counts.max()])
+
+
+def colors(values: np.ndarray) -> np.ndarray:
+    """Map values to hex colors from blue (lowest) to red (highest)."""
+    values = np.asarray(values, dtype=float)
+    span = values.max() - values.min() if len(values) else 0
+    ratio = (values - values.min()) / span if span else np.zeros(len(values))
+    red = (255 * ratio).astype(int)
+    blue = 255 - red
+    return np.array([f"#{r:02x}40{b:02x}" for r, b in zip(red, blue)])
@@ -6,12 +6,19 @@ Call:
     gohome()
 """
 
-from typing import Any  # pragma: no cover
+from typing import Any, Dict  # pragma: no cover
 
 import ipyleaflet as lf  # pragma: no cover
 import ipywidgets as wd  # pragma: no cover
 import numpy as np  # pragma: no cover
 
+from pygohome.coverage import (  # pragma: no cover
+    colors,
+    edge_coverage,
+    heat_points,
+    simplify_edges,
+)
+from pygohome.routing import is_poi  # pragma: no cover
 from pygohome.world import World  # pragma: no cover
 
 
@@ -33,13 +40,14 @@ def gohome() -> lf.Map:  # pragma: no cover
                 world.add_gpx(content["content"].decode("utf-8"))
             load_progress.value = item_i + 1
         world._ensure_graph()
-        pois = sorted(
-            node
-            for node in world.graph.nodes
-            if isinstance(node, str) and not node.isdigit()
-        )
+        pois = sorted(node for node in world.graph.nodes if is_poi(node))
         route_src.options = pois
         route_dst.options = pois
+        coverage_data["edges"] = edge_coverage(world.graph)
+        coverage_data["points"] = np.array(
+            [(lat, lon) for _, lat, lon in world.trackpoints]
+        ).reshape(-1, 2)
+        action_coverage(None)
 
     load_list = wd.FileUpload(accept=".gpx", multiple=True)
     load_btn = wd.Button(description="Load GPX files")
@@ -87,10 +95,13 @@ def gohome() -> lf.Map:  # pragma: no cover
             nodes[route_src.value]["latitude"],
             nodes[route_src.value]["longitude"],
         )
-        period_exp, period_min, period_max = 0, 0, 0
+        # a fixed seed shows the same time for the same route every time
+        period_exp = world.route_distribution(
+            fp, quantiles=[route_slider.value], seed=0
+        ).quantiles[route_slider.value]
+        period_min, period_max = 0, 0
         for edge in fp.edges:
             secs = world.graph.edges[edge]["secs"]
-            period_exp += np.quantile(secs, route_slider.value)
             period_min += min(secs)
             period_max += max(secs)
 
@@ -107,9 +118,76 @@ def gohome() -> lf.Map:  # pragma: no cover
         children=[route_src, route_dst, route_slider, route_btn, route_result]
     )
 
-    tab_box = wd.Tab(children=[load_box, route_box])
+    coverage_data: Dict[str, Any] = {}
+    coverage = lf.GeoJSON(
+        data={"type": "FeatureCollection", "features": []},
+        style_callback=lambda feature: {
+            "color": feature["properties"]["color"],
+            "weight": 3,
+            "opacity": 0.8,
+        },
+    )
+    m.add_layer(coverage)
+    heat = lf.Heatmap(locations=[], radius=12, blur=8)
+    m.add_layer(heat)
+
+    coverage_color = wd.Dropdown(
+        options=[("traversals", "count"), ("median time", "median")],
+        description="Color:",
+    )
+    coverage_edges = wd.Checkbox(value=True, description="Show edges")
+    coverage_heat = wd.Checkbox(value=False, description="Show trackpoints")
+
+    def action_coverage(change: Any) -> None:
+        # only the cells and edges within the visible bounds are sent,
+        # simplified to the zoom level
+        if "edges" not in coverage_data:
+            return
+        features = []
+        if coverage_edges.value:
+            edges = simplify_edges(
+                coverage_data["edges"], int(m.zoom), bounds=m.bounds or None
+            )
+            for row, color in zip(
+                edges.itertuples(), colors(edges[coverage_color.value])
+            ):
+                features.append(
+                    {
+                        "type": "Feature",
+                        "properties": {"color": color},
+                        "geometry": {
+                            "type": "LineString",
+                            "coordinates": [
+                                [row.src_longitude, row.src_latitude],
+                                [row.dst_longitude, row.dst_latitude],
+                            ],
+                        },
+                    }
+                )
+        coverage.data = {"type": "FeatureCollection", "features": features}
+        points = coverage_data["points"]
+        if coverage_heat.value:
+            heat.locations = heat_points(
+                points[:, 0],
+                points[:, 1],
+                int(m.zoom),
+                bounds=m.bounds or None,
+            ).tolist()
+        else:
+            heat.locations = []
+
+    for widget in (coverage_color, coverage_edges, coverage_heat):
+        widget.observe(action_coverage, names="value")
+    # zooming changes the bounds too
+    m.observe(action_coverage, names="bounds")
+    coverage_box = wd.VBox(
+        children=[coverage_color, coverage_edges, coverage_heat]
+    )
+
+    tab_box = wd.Tab(children=[load_box, route_box, coverage_box])
     tab_box.set_title(0, "Load GPX files")
     tab_box.set_title(1, "Fastest route")
+    tab_box.set_title(2, "Coverage")
 
     ctrl_tab = lf.WidgetControl(widget=tab_box, position="topright")
     m.add_control(ctrl_tab)
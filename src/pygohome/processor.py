@@ -42,7 +42,21 @@ def prepare_trackpoints(
 
     # convert lat/lon to UTM
     dfr = latlon_to_utm(raw_dfr)
+    return segment_trackpoints(timestamp, dfr)
 
+
+def utc_timestamp(timestamp: dt.datetime) -> pd.Timestamp:
+    """Convert to a UTC timestamp, naive ones are considered UTC."""
+    timestamp = pd.Timestamp(timestamp)
+    if timestamp.tzinfo is None:
+        return timestamp.tz_localize("UTC")
+    return timestamp.tz_convert("UTC")
+
+
+def segment_trackpoints(
+    timestamp: pd.Series, dfr: pd.DataFrame
+) -> pd.DataFrame:
+    """Add segments and offsets to the trackpoints sorted by timestamp."""
     # split into numbered segments (at least 1 minute break between points)
     dfr["segment"] = (timestamp.diff() > pd.Timedelta("00:01:00")).cumsum()
 
@@ -94,6 +108,57 @@ def latlon_to_utm(latlon: pd.DataFrame) -> pd.DataFrame:
     return dfr
 
 
+def downsample_trackpoints(
+    dfr_trackpoints: pd.DataFrame,
+    dfr_waypoints: pd.DataFrame,
+    max_dist: int = 30,
+    max_error: int = 0,
+    block_secs: int = 10,
+) -> pd.DataFrame:
+    """Drop trackpoints not needed to find the encounters.
+
+    The points are split into `block_secs` long blocks: if the first
+    point of a block is farther from every waypoint than `max_dist` plus
+    the farthest the block moves away from it, the whole block is
+    dropped. In the remaining blocks the first and last point of every
+    run near the same waypoint are kept, so the encounters do not change;
+    of the other points only the first of every `max_error + 1` seconds
+    is kept.
+    """
+    segment = dfr_trackpoints["segment"]
+
+    def is_first(secs: int) -> pd.Series:
+        bucket = dfr_trackpoints["offset"] // secs
+        return (segment != segment.shift()) | (bucket != bucket.shift())
+
+    is_probe = is_first(block_secs)
+    block = is_probe.cumsum().to_numpy() - 1
+    utm = dfr_trackpoints[["utm_x", "utm_y"]].to_numpy(dtype=float)
+    probes = utm[is_probe.to_numpy()]
+    moved = (
+        pd.Series(np.hypot(*(utm - probes[block]).T))
+        .groupby(block)
+        .max()
+        .to_numpy()
+    )
+    kdtree = cKDTree(dfr_waypoints[["utm_x", "utm_y"]])
+    dists = kdtree.query(probes)[0]
+    is_near = (dists <= max_dist + moved)[block]
+
+    # the nearest waypoint of the points left, kdtree.n if none is close
+    dfr = dfr_trackpoints[is_near]
+    nodes = kdtree.query(
+        dfr[["utm_x", "utm_y"]], distance_upper_bound=max_dist
+    )[1]
+    runs = pd.Series(nodes, index=dfr.index)
+    is_change = (runs != runs.shift()) | (
+        dfr["segment"] != dfr["segment"].shift()
+    )
+    is_edge = is_change | is_change.shift(-1, fill_value=True)
+    is_edge &= nodes < kdtree.n
+    return dfr[is_edge | is_first(max_error + 1)[is_near]]
+
+
 def find_encounters(
     dfr_trackpoints: pd.DataFrame,
     dfr_waypoints: pd.DataFrame,
@@ -126,6 +191,105 @@ def find_encounters(
     return dfr_encounters
 
 
+def match_encounters(
+    dfr_trackpoints: pd.DataFrame,
+    dfr_waypoints: pd.DataFrame,
+    max_dist: int = 30,
+) -> pd.DataFrame:
+    """Find encounters of the lines between trackpoints near waypoints.
+
+    Unlike `find_encounters`, a waypoint is encountered even if the track
+    passes it between two points. The `start` and `end` are interpolated
+    to the moments the line enters and leaves the `max_dist` circle.
+    """
+    utm = dfr_trackpoints[["utm_x", "utm_y"]].to_numpy(dtype=float)
+    offset = dfr_trackpoints["offset"].to_numpy(dtype=float)
+    segment = dfr_trackpoints["segment"].to_numpy()
+
+    # every point starts a line to the next point of its segment,
+    # the last point of a segment is a line of zero length
+    nxt = np.arange(len(utm)) + 1
+    is_last = np.append(segment[1:] != segment[:-1], True)
+    nxt[is_last] = np.flatnonzero(is_last)
+    src, dst = utm, utm[nxt]
+    half = np.hypot(*(dst - src).T) / 2
+
+    # candidate waypoints are near the middle of the line
+    kdtree = cKDTree(dfr_waypoints[["utm_x", "utm_y"]])
+    candidates = kdtree.query_ball_point((src + dst) / 2, max_dist + half)
+    counts = np.array([len(nodes) for nodes in candidates], dtype=int)
+    line = np.repeat(np.arange(len(utm)), counts)
+    node = np.concatenate([np.zeros(0, dtype=int)] + list(candidates))
+    node = node.astype(int)
+
+    # solve |src + t * (dst - src) - node| = max_dist for t
+    delta = dst[line] - src[line]
+    rel = src[line] - kdtree.data[node]
+    a = (delta**2).sum(axis=1)
+    b = 2 * (delta * rel).sum(axis=1)
+    c = (rel**2).sum(axis=1) - max_dist**2
+    with np.errstate(divide="ignore", invalid="ignore"):
+        root = np.sqrt(b**2 - 4 * a * c)
+        t_in = np.where(a > 0, (-b - root) / (2 * a), 0)
+        t_out = np.where(a > 0, (-b + root) / (2 * a), 1)
+    is_hit = np.where(a > 0, (t_in <= 1) & (t_out >= 0), c <= 0)
+    is_hit &= np.isfinite(t_in) & np.isfinite(t_out)
+    t_in, t_out = np.clip(t_in, 0, 1), np.clip(t_out, 0, 1)
+
+    # keep only the nearest waypoint at every moment, like `find_encounters`:
+    # the squared distances share a * t**2, so the nearest has the lowest
+    # b * t + c and is the nearest on an interval of t clipped from pairs
+    dfr_hits = pd.DataFrame(
+        {"line": line, "node": node, "b": b, "c": c, "hit": np.arange(len(a))}
+    )[is_hit]
+    pairs = dfr_hits.merge(dfr_hits, on="line")
+    pairs = pairs[pairs["hit_x"] != pairs["hit_y"]]
+    slope = (pairs["b_x"] - pairs["b_y"]).to_numpy()
+    diff = (pairs["c_y"] - pairs["c_x"]).to_numpy()
+    # equally near waypoints go to the first one
+    is_tied = (diff == 0) & (pairs["node_x"] < pairs["node_y"]).to_numpy()
+    with np.errstate(divide="ignore", invalid="ignore"):
+        bound = diff / slope
+    pairs = pairs.assign(
+        low=np.where(slope < 0, bound, -np.inf),
+        high=np.where(slope > 0, bound, np.inf),
+    )
+    is_farther = (slope == 0) & ((diff < 0) | ((diff == 0) & ~is_tied))
+    pairs.loc[is_farther, "low"] = np.inf
+    limits = pairs.groupby("hit_x").agg(
+        low=("low", "max"), high=("high", "min")
+    )
+    t_in[limits.index] = np.maximum(t_in[limits.index], limits["low"])
+    t_out[limits.index] = np.minimum(t_out[limits.index], limits["high"])
+    is_hit &= t_in < t_out
+
+    duration = offset[nxt][line] - offset[line]
+    dfr = pd.DataFrame(
+        {
+            "line": line,
+            "segment": segment[line],
+            "start": offset[line] + t_in * duration,
+            "end": offset[line] + t_out * duration,
+            "node": dfr_waypoints.index[node],
+        }
+    )[is_hit].sort_values(["line", "start"], kind="stable")
+
+    # join the consecutive lines near the same waypoint into one encounter
+    is_new = (dfr["node"] != dfr["node"].shift()) | (
+        dfr["segment"] != dfr["segment"].shift()
+    )
+    dfr_encounters = dfr.groupby(is_new.cumsum().to_numpy()).agg(
+        segment=("segment", "first"),
+        start=("start", "min"),
+        end=("end", "max"),
+        node=("node", "first"),
+    )
+    dfr_encounters[["start", "end"]] = (
+        dfr_encounters[["start", "end"]].round().astype(int)
+    )
+    return dfr_encounters
+
+
 def build_graph(
     dfr_encounters: pd.DataFrame, dfr_waypoints: pd.DataFrame
 ) -> nx.DiGraph:
@@ -0,0 +1,499 @@
+"""Routing helpers working on a graph built by the processor."""
+
+import heapq
+import itertools
+import math
+from typing import (
+    Any,
+    Dict,
+    Hashable,
+    List,
+    NamedTuple,
+    Optional,
+    Sequence,
+    Set,
+    Tuple,
+)
+
+import networkx as nx
+import numpy as np
+
+
+class PoiTable(NamedTuple):
+    """Precomputed routes from every POI for a single quantile.
+
+    Row `r` of `periods` and `preds` belongs to the POI `p` with
+    `pois[p] == r`, column `c` to the graph node `nodes[c]`.
+    Missing values (unreachable nodes) are -1.
+    """
+
+    nodes: List[Hashable]
+    index: Dict[Hashable, int]
+    pois: Dict[str, int]
+    periods: np.ndarray
+    preds: np.ndarray
+
+
+class ContractedGraph(NamedTuple):
+    """Graph reduced by contracting intersections for a single quantile.
+
+    Every edge of `core` has a `weight` and `via`, the tuple of contracted
+    nodes the edge stands for.
+    """
+
+    quantile: float
+    core: nx.DiGraph
+
+
+class RouteDistribution(NamedTuple):
+    """Simulated distribution of the total period of a route.
+
+    `bands` maps the width of a central band (e.g. 0.9) to its
+    lower and upper bound (e.g. the 5th and the 95th percentile).
+    """
+
+    totals: np.ndarray
+    quantiles: Dict[float, float]
+    bands: Dict[float, Tuple[float, float]]
+
+
+class SweepRun(NamedTuple):
+    """Consecutive quantiles sharing the same fastest path."""
+
+    quantiles: np.ndarray
+    path: Any
+    periods: np.ndarray
+
+
+def is_poi(node: Any) -> bool:
+    """Return True if the node is a named point of interest."""
+    return isinstance(node, str) and not node.isdigit()
+
+
+def edge_weights(
+    graph: nx.DiGraph, quantile: float
+) -> Dict[Tuple[Hashable, Hashable], float]:
+    """Return the quantile of `secs` for every edge of the graph."""
+    return {
+        (u, v): np.quantile(secs, quantile)
+        for u, v, secs in graph.edges(data="secs")
+    }
+
+
+def edge_quantiles(
+    graph: nx.DiGraph, quantiles: Sequence[float]
+) -> Tuple[List[Tuple[Hashable, Hashable]], np.ndarray]:
+    """Return the edges and a matrix of their `secs` quantiles.
+
+    The matrix has one row per edge and one column per quantile,
+    the values are the same as from `np.quantile` (linear method).
+    """
+    edges = [(u, v) for u, v, _ in graph.edges(data="secs")]
+    secs = [secs for _, _, secs in graph.edges(data="secs")]
+    counts = np.array([len(edge_secs) for edge_secs in secs], dtype=int)
+    starts = np.cumsum(counts) - counts
+    flat = np.concatenate([np.zeros(0)] + secs).astype(float)
+
+    virtual = (counts[:, None] - 1) * np.asarray(quantiles, dtype=float)
+    previous = np.floor(virtual)
+    gamma = virtual - previous
+    last = counts[:, None] - 1
+    lower = flat[starts[:, None] + np.minimum(previous.astype(int), last)]
+    upper = flat[starts[:, None] + np.minimum(previous.astype(int) + 1, last)]
+    diff = upper - lower
+    # the same interpolation as `np.quantile` for bitwise equal results
+    return edges, np.where(
+        gamma >= 0.5, upper - diff * (1 - gamma), lower + diff * gamma
+    )
+
+
+def build_poi_table(graph: nx.DiGraph, quantile: float) -> PoiTable:
+    """Run one search from every POI and store the results in arrays."""
+    nodes = list(graph.nodes)
+    index = {node: col for col, node in enumerate(nodes)}
+    pois = {
+        node: row
+        for row, node in enumerate(node for node in nodes if is_poi(node))
+    }
+    weights = edge_weights(graph, quantile)
+    periods = np.full((len(pois), len(nodes)), -1, dtype=np.int64)
+    preds = np.full((len(pois), len(nodes)), -1, dtype=np.int32)
+    for src, row in pois.items():
+        # the same weights as in `World.fastest_path`, the first predecessor
+        # is the one `nx.dijkstra_path` would have chosen
+        pred = nx.dijkstra_predecessor_and_distance(
+            graph, src, weight=lambda u, v, a: weights[u, v]
+        )[0]
+        for node, node_preds in pred.items():
+            if node_preds:
+                preds[row, index[node]] = index[node_preds[0]]
+
+        # the same weights as in `World.single_source_periods`
+        dist = nx.single_source_dijkstra_path_length(
+            graph, src, weight=lambda u, v, a: int(weights[u, v])
+        )
+        periods[row, [index[node] for node in dist]] = list(dist.values())
+    return PoiTable(nodes, index, pois, periods, preds)
+
+
+def table_path(table: PoiTable, src: str, dst: Hashable) -> List[Hashable]:
+    """Follow the predecessors from dst back to src."""
+    row, col_src = table.pois[src], table.index[src]
+    col = table.index[dst]
+    cols = [col]
+    while col != col_src:
+        col = table.preds[row, col]
+        if col < 0:
+            raise nx.NetworkXNoPath(f"No path to {dst}.")
+        cols.append(col)
+    return [table.nodes[col] for col in reversed(cols)]
+
+
+def table_periods(table: PoiTable, src: str) -> Dict[Hashable, int]:
+    """Return periods to every reachable node from src."""
+    periods = table.periods[table.pois[src]]
+    return {
+        table.nodes[col]: int(periods[col])
+        for col in np.flatnonzero(periods >= 0)
+    }
+
+
+def contract_graph(
+    graph: nx.DiGraph, quantile: float, max_settled: int = 50
+) -> ContractedGraph:
+    """Contract the intersections that do not add more edges than they have.
+
+    The periods between the remaining nodes (all POIs among them)
+    stay the same, the removed nodes are replaced by shortcut edges.
+    """
+    core = nx.DiGraph()
+    core.add_nodes_from(graph)
+    core.add_edges_from(
+        (u, v, {"weight": weight, "via": ()})
+        for (u, v), weight in edge_weights(graph, quantile).items()
+    )
+    # contract the least important intersections first,
+    # the counter avoids comparing str and tuple nodes
+    heap = [
+        (_edge_difference(core, node), counter, node)
+        for counter, node in enumerate(core)
+        if not is_poi(node)
+    ]
+    heapq.heapify(heap)
+    while heap:
+        priority, counter, node = heapq.heappop(heap)
+        current = _edge_difference(core, node)
+        if current > priority:
+            heapq.heappush(heap, (current, counter, node))
+            continue
+        shortcuts = _shortcuts(core, node, max_settled)
+        if len(shortcuts) <= core.in_degree(node) + core.out_degree(node):
+            core.remove_node(node)
+            core.add_edges_from(shortcuts)
+    return ContractedGraph(quantile, core)
+
+
+def _edge_difference(core: nx.DiGraph, node: Hashable) -> int:
+    """Estimate how many edges the contraction of node would add."""
+    in_degree, out_degree = core.in_degree(node), core.out_degree(node)
+    return in_degree * out_degree - in_degree - out_degree
+
+
+def _shortcuts(
+    core: nx.DiGraph, node: Hashable, max_settled: int
+) -> List[Tuple[Hashable, Hashable, Dict]]:
+    """Return the edges needed to keep the periods without node."""
+    shortcuts = []
+    for src, in_data in core.pred[node].items():
+        weights = {
+            dst: in_data["weight"] + out_data["weight"]
+            for dst, out_data in core.succ[node].items()
+            if dst != src
+        }
+        if not weights:
+            continue
+        witness = _witness_search(
+            core, src, node, max(weights.values()), max_settled
+        )
+        for dst, weight in weights.items():
+            # a shortcut must never replace a faster existing edge
+            if dst in core.succ[src]:
+                witness[dst] = min(
+                    witness.get(dst, math.inf), core[src][dst]["weight"]
+                )
+            if witness.get(dst, math.inf) > weight:
+                via = in_data["via"] + (node,) + core[node][dst]["via"]
+                shortcuts.append((src, dst, {"weight": weight, "via": via}))
+    return shortcuts
+
+
+def _witness_search(
+    core: nx.DiGraph,
+    src: Hashable,
+    avoid: Hashable,
+    max_weight: float,
+    max_settled: int,
+) -> Dict[Hashable, float]:
+    """Search a few nodes around src, return distances not passing avoid."""
+    dist: Dict[Hashable, float] = {}
+    seen = {src: 0.0}
+    heap = [(0.0, 0, src)]
+    counter = 1
+    while heap and len(dist) < max_settled:
+        weight, _, node = heapq.heappop(heap)
+        if node in dist:
+            continue
+        if weight > max_weight:
+            break
+        dist[node] = weight
+        for succ, data in core.succ[node].items():
+            succ_weight = weight + data["weight"]
+            if succ != avoid and succ_weight < seen.get(succ, math.inf):
+                seen[succ] = succ_weight
+                heapq.heappush(heap, (succ_weight, counter, succ))
+                counter += 1
+    return dist
+
+
+def contracted_path(
+    contracted: ContractedGraph, src: Hashable, dst: Hashable
+) -> List[Hashable]:
+    """Search the core in both directions and expand the shortcuts."""
+    core = contracted.core
+    core_path = nx.bidirectional_dijkstra(core, src, dst, weight="weight")[1]
+    path = [src]
+    for u, v in zip(core_path, core_path[1:]):
+        path.extend(core[u][v]["via"])
+        path.append(v)
+    return path
+
+
+def sample_periods(
+    graph: nx.DiGraph,
+    paths: Sequence[Sequence[Hashable]],
+    samples: int,
+    seed: Optional[int] = None,
+) -> np.ndarray:
+    """Draw total periods of the paths from the recorded `secs` of edges.
+
+    Every edge of every path draws `samples` values at once,
+    the result has one row per path and one column per sample.
+    """
+    path_edges = [list(zip(path, path[1:])) for path in paths]
+    edges = [edge for edges in path_edges for edge in edges]
+    secs = [graph.edges[edge]["secs"] for edge in edges]
+    lengths = np.array([len(edge_secs) for edge_secs in secs], dtype=int)
+    starts = np.cumsum(lengths) - lengths
+    flat = np.concatenate([np.zeros(0, dtype=int)] + secs)
+
+    rng = np.random.default_rng(seed)
+    draws = (rng.random((len(edges), samples)) * lengths[:, None]).astype(int)
+    values = flat[starts[:, None] + draws]
+
+    # sum the rows of each path via differences of the cumulative sum
+    counts = np.array([len(edges) for edges in path_edges], dtype=int)
+    ends = np.cumsum(counts)
+    cumsum = np.vstack(
+        [np.zeros((1, samples), dtype=int), np.cumsum(values, axis=0)]
+    )
+    return cumsum[ends] - cumsum[ends - counts]
+
+
+def describe_periods(
+    totals: np.ndarray, quantiles: Sequence[float], bands: Sequence[float]
+) -> List[RouteDistribution]:
+    """Add the quantiles and the central bands to each row of totals."""
+    bounds = [(1 - band) / 2 for band in bands]
+    probs = [*quantiles, *bounds, *(1 - bound for bound in bounds)]
+    values = np.quantile(totals, probs, axis=1).T
+    result = []
+    for row, row_values in zip(totals, values):
+        lower = row_values[len(quantiles) : len(quantiles) + len(bands)]
+        upper = row_values[len(quantiles) + len(bands) :]
+        result.append(
+            RouteDistribution(
+                row,
+                dict(zip(quantiles, row_values[: len(quantiles)])),
+                dict(zip(bands, zip(lower, upper))),
+            )
+        )
+    return result
+
+
+def alternative_paths(
+    graph: nx.DiGraph,
+    src: Hashable,
+    dst: Hashable,
+    quantile: float,
+    k: int = 3,
+    max_detour: float = 1.5,
+) -> List[Tuple[float, List[Hashable]]]:
+    """Find up to k fastest paths passing different places (Yen's algorithm).
+
+    Paths slower than `max_detour` times the fastest one are dropped.
+    The edge weights and one reverse search from dst are computed once,
+    the reverse periods guide and prune all the following searches.
+    """
+    weights = edge_weights(graph, quantile)
+    to_dst = nx.single_source_dijkstra_path_length(
+        graph.reverse(copy=False), dst, weight=lambda u, v, a: weights[v, u]
+    )
+    if src not in to_dst:
+        raise nx.NetworkXNoPath(f"No path to {dst}.")
+
+    # the first path is the one `World.fastest_path` returns
+    path = nx.dijkstra_path(
+        graph, src, dst, weight=lambda u, v, a: weights[u, v]
+    )
+    max_period = _path_period(path, weights) * max_detour
+    found = [(_path_period(path, weights), path)]
+    candidates: List[Tuple[float, int, List[Hashable]]] = []
+    seen = {tuple(path)}
+    result = [found[0]]
+    places = {_places(path)}
+    while len(result) < k:
+        last = found[-1][1]
+        root_period = 0.0
+        for pos, spur in enumerate(last[:-1]):
+            root = last[: pos + 1]
+            spur_result = _guided_search(
+                graph,
+                spur,
+                dst,
+                weights,
+                to_dst,
+                set(root[:-1]),
+                {
+                    (prev[pos], prev[pos + 1])
+                    for _, prev in found
+                    if prev[: pos + 1] == root
+                },
+                max_period - root_period,
+            )
+            if spur_result is not None:
+                period, spur_path = spur_result
+                path = root[:-1] + spur_path
+                if tuple(path) not in seen:
+                    seen.add(tuple(path))
+                    heapq.heappush(
+                        candidates,
+                        (root_period + period, len(seen), path),
+                    )
+            root_period += weights[spur, last[pos + 1]]
+        if not candidates:
+            break
+        period, _, path = heapq.heappop(candidates)
+        found.append((period, path))
+        # paths differing only in the lanes of slow intersections
+        # are no meaningful alternatives
+        if _places(path) not in places:
+            places.add(_places(path))
+            result.append((period, path))
+    return result
+
+
+def _path_period(
+    path: Sequence[Hashable], weights: Dict[Tuple[Hashable, Hashable], float]
+) -> float:
+    """Sum the weights along the path."""
+    return sum(weights[u, v] for u, v in zip(path, path[1:]))
+
+
+def _places(path: Sequence[Hashable]) -> Tuple[Hashable, ...]:
+    """Replace intersection sub-nodes by their place, drop the repetitions."""
+    places: List[Hashable] = []
+    for node in path:
+        place = node[0] if isinstance(node, tuple) else node
+        if not places or places[-1] != place:
+            places.append(place)
+    return tuple(places)
+
+
+def _guided_search(
+    graph: nx.DiGraph,
+    src: Hashable,
+    dst: Hashable,
+    weights: Dict[Tuple[Hashable, Hashable], float],
+    to_dst: Dict[Hashable, float],
+    blocked_nodes: Set[Hashable],
+    blocked_edges: Set[Tuple[Hashable, Hashable]],
+    max_period: float,
+) -> Optional[Tuple[float, List[Hashable]]]:
+    """Search with the periods to dst as an A* heuristic.
+
+    Blocking nodes and edges only makes the periods longer,
+    so the unblocked periods to dst never overestimate.
+    """
+    periods = {src: 0.0}
+    preds: Dict[Hashable, Hashable] = {}
+    heap = [(to_dst[src], 0.0, 0, src)]
+    counter = 1
+    done = set()
+    while heap:
+        _, period, _, node = heapq.heappop(heap)
+        if node == dst:
+            path = [dst]
+            while path[-1] != src:
+                path.append(preds[path[-1]])
+            return period, path[::-1]
+        if node in done:
+            continue
+        done.add(node)
+        for succ in graph.succ[node]:
+            if succ in blocked_nodes or (node, succ) in blocked_edges:
+                continue
+            succ_period = period + weights[node, succ]
+            if succ not in to_dst or succ_period >= periods.get(
+                succ, math.inf
+            ):
+                continue
+            estimate = succ_period + to_dst[succ]
+            if estimate > max_period:
+                continue
+            periods[succ] = succ_period
+            preds[succ] = node
+            heapq.heappush(heap, (estimate, succ_period, counter, succ))
+            counter += 1
+    return None
+
+
+def quantile_sweep(
+    graph: nx.DiGraph,
+    src: Hashable,
+    dst: Hashable,
+    quantiles: Sequence[float],
+) -> List[SweepRun]:
+    """Find the fastest paths for many quantiles at once.
+
+    All edge weights are computed as one matrix, then every quantile is
+    searched with its column. Only the weights are batched: the searches
+    are not shared, real `secs` give different weights for every quantile.
+    Consecutive quantiles with the same path are merged into one run.
+    """
+    edges, weights = edge_quantiles(graph, quantiles)
+    edge_index = {edge: row for row, edge in enumerate(edges)}
+    paths = [
+        nx.dijkstra_path(
+            graph,
+            src,
+            dst,
+            weight=lambda u, v, a, column=column: column[edge_index[u, v]],
+        )
+        for column in weights.T
+    ]
+
+    runs = []
+    for _, group in itertools.groupby(
+        range(len(quantiles)), key=lambda col: paths[col]
+    ):
+        cols = list(group)
+        path = paths[cols[0]]
+        rows = [edge_index[edge] for edge in zip(path, path[1:])]
+        runs.append(
+            SweepRun(
+                np.asarray(quantiles, dtype=float)[cols],
+                path,
+                weights[np.ix_(rows, cols)].sum(axis=0),
+            )
+        )
+    return runs
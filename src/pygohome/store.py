@@ -0,0 +1,119 @@
+"""Trackpoints stored on disk as a partitioned Parquet dataset.
+
+Needs the optional `pyarrow` package:
+
+    pip install pygohome[parquet]
+"""
+
+import datetime as dt
+import functools
+import operator
+import uuid
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple, Union
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+
+from pygohome.processor import (
+    latlon_to_utm,
+    segment_trackpoints,
+    utc_timestamp,
+)
+
+COLUMNS = ["timestamp", "utm_x", "utm_y", "utm_zone", "utm_ch"]
+
+
+class TrackStore:
+    """Append-only store of trackpoints projected to UTM.
+
+    Every append writes new files to monthly partitions, existing files
+    are never rewritten. Each file holds a time-sorted batch of points.
+    """
+
+    path: Path
+
+    def __init__(self, path: Union[str, Path]) -> None:
+        """Open or create the store in the directory."""
+        self.path = Path(path)
+        self.path.mkdir(parents=True, exist_ok=True)
+
+    def append(
+        self, trackpoints: List[Tuple[dt.datetime, float, float]]
+    ) -> None:
+        """Project the trackpoints to UTM and write them to new files."""
+        if not trackpoints:
+            return
+        raw_dfr = pd.DataFrame.from_records(
+            trackpoints, columns=("timestamp", "latitude", "longitude")
+        ).sort_values("timestamp")
+        dfr = latlon_to_utm(raw_dfr)
+        dfr.insert(
+            0, "timestamp", pd.to_datetime(raw_dfr["timestamp"], utc=True)
+        )
+        dfr["month"] = dfr["timestamp"].dt.strftime("%Y-%m")
+        ds.write_dataset(
+            pa.Table.from_pandas(dfr, preserve_index=False),
+            self.path,
+            format="parquet",
+            partitioning=["month"],
+            partitioning_flavor="hive",
+            basename_template=f"{uuid.uuid4().hex}-{{i}}.parquet",
+            existing_data_behavior="overwrite_or_ignore",
+        )
+
+    def files(self) -> List[str]:
+        """Return the files written so far."""
+        return ds.dataset(self.path, format="parquet").files
+
+    def batches(
+        self,
+        start: Optional[dt.datetime] = None,
+        end: Optional[dt.datetime] = None,
+        files: Optional[List[str]] = None,
+    ) -> Iterator[pd.DataFrame]:
+        """Read prepared trackpoints one append at a time.
+
+        Only the needed columns and the rows between start (inclusive)
+        and end (exclusive) are read, whole months outside are skipped.
+        With `files` from `files()`, later appends are not read.
+        """
+        if files is None:
+            files = self.files()
+        # an empty dataset has no month field to filter on
+        if not files:
+            return
+        dataset = ds.dataset(
+            files,
+            format="parquet",
+            partitioning="hive",
+            partition_base_dir=str(self.path),
+        )
+        conditions = []
+        if start is not None:
+            start = utc_timestamp(start)
+            conditions.append(ds.field("month") >= start.strftime("%Y-%m"))
+            conditions.append(ds.field("timestamp") >= pa.scalar(start))
+        if end is not None:
+            end = utc_timestamp(end)
+            conditions.append(ds.field("month") <= end.strftime("%Y-%m"))
+            conditions.append(ds.field("timestamp") < pa.scalar(end))
+        expression = functools.reduce(
+            operator.and_, conditions, ds.scalar(True)
+        )
+        # the files of one append share their name in all the partitions
+        appends: Dict[str, List[ds.Fragment]] = {}
+        for fragment in dataset.get_fragments(filter=expression):
+            appends.setdefault(Path(fragment.path).name, []).append(fragment)
+        for fragments in appends.values():
+            dfr = pa.concat_tables(
+                fragment.to_table(
+                    columns=COLUMNS, filter=expression, schema=dataset.schema
+                )
+                for fragment in fragments
+            ).to_pandas()
+            if dfr.empty:
+                continue
+            dfr = dfr.sort_values("timestamp", ignore_index=True)
+            yield segment_trackpoints(dfr.pop("timestamp"), dfr)
@@ -7,43 +7,186 @@ and a graph that will tell you how to get from A to B.
 
 import datetime as dt
 import math
-from typing import Dict, List, Tuple
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import (
+    TYPE_CHECKING,
+    Dict,
+    Hashable,
+    Iterable,
+    Iterator,
+    List,
+    NamedTuple,
+    Optional,
+    Sequence,
+    Tuple,
+)
 
 import networkx as nx
 import numpy as np
+import pandas as pd
 
 from pygohome.convert import extract_gpx
 from pygohome.processor import (
+    EmptyDataError,
     RegionTooLargeError,
     build_graph,
+    downsample_trackpoints,
     find_encounters,
+    match_encounters,
     prepare_trackpoints,
     prepare_waypoints,
+    utc_timestamp,
+)
+from pygohome.routing import (
+    ContractedGraph,
+    PoiTable,
+    RouteDistribution,
+    SweepRun,
+    alternative_paths,
+    build_poi_table,
+    contract_graph,
+    contracted_path,
+    describe_periods,
+    quantile_sweep,
+    sample_periods,
+    table_path,
+    table_periods,
 )
 
+if TYPE_CHECKING:  # pragma: no cover
+    from pygohome.store import TrackStore
+
+
+class Snapshot(NamedTuple):
+    """Everything the queries need, built from one version of the data."""
+
+    version: int
+    graph: nx.DiGraph
+    poi_tables: Dict[float, PoiTable]
+    contracted: Optional[ContractedGraph]
+
+
+class TrackBatch(NamedTuple):
+    """Trackpoints added at once with the UTC time span they cover."""
+
+    num: int
+    first: pd.Timestamp
+    last: pd.Timestamp
+    trackpoints: List[Tuple[dt.datetime, float, float]]
+
 
 class World:
     """Your world."""
 
     trackpoints: List[Tuple[dt.datetime, float, float]]
     waypoints: List[Tuple[str, float, float]]
-    graph: nx.DiGraph
+    poi_quantiles: Tuple[float, ...]
+    contraction_quantile: Optional[float]
+    background: bool
+    downsample: Optional[int]
+    store: Optional["TrackStore"]
+    window: Optional[dt.timedelta]
+    interpolate: bool
+
+    def __init__(
+        self,
+        poi_quantiles: Sequence[float] = (),
+        contraction_quantile: Optional[float] = None,
+        background: bool = False,
+        downsample: Optional[int] = None,
+        store: Optional["TrackStore"] = None,
+        window: Optional[dt.timedelta] = None,
+        interpolate: bool = False,
+    ) -> None:
+        """Init an empty world.
 
-    def __init__(self) -> None:
-        """Init an empty world."""
+        For each of `poi_quantiles` a table of routes between all POIs
+        is precomputed with every graph rebuild.
+        For `contraction_quantile` the intersections are contracted
+        to speed up the searches between the remaining nodes.
+        With `background`, every modification starts a rebuild in another
+        thread and the queries are served from the previous graph until
+        the new one is complete. The error of a failed rebuild is raised
+        by the queries until a later rebuild succeeds.
+        With `downsample`, trackpoints far from all waypoints are dropped
+        and the points between the first and last one near a waypoint
+        thinned to one every `downsample + 1` seconds.
+        With `store`, the trackpoints are kept on disk instead of memory
+        and read back one batch at a time.
+        With `window`, the graph is built only from the trackpoints
+        recorded within the window before now. The encounters of each
+        added batch of trackpoints are found once and reused, batches
+        older than the window are dropped without being processed;
+        `trackpoints` still keeps all of them.
+        With `interpolate`, the lines between trackpoints are matched
+        to the waypoints, so that sparse tracks do not miss any of them;
+        `downsample` is not used then, it would join distant points.
+        """
         self.trackpoints = []
         self.waypoints = []
-        self.graph = None
+        self.poi_quantiles = tuple(poi_quantiles)
+        self.contraction_quantile = contraction_quantile
+        self.background = background
+        self.downsample = downsample
+        self.store = store
+        self.window = window
+        self.interpolate = interpolate
+        self._batches: List[TrackBatch] = []
+        self._batch_count = 0
+        self._encounter_cache: Dict[int, Tuple[pd.DataFrame, int]] = {}
+        self._encounter_cache_key: Tuple = ()
+        self._version = 0
+        self._snapshot: Optional[Snapshot] = None
+        self._lock = threading.Lock()
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._rebuild: Optional[Future] = None
+        self._rebuild_queued = False
+        self._rebuild_error: Optional[Tuple[int, Exception]] = None
+
+    @property
+    def graph(self) -> Optional[nx.DiGraph]:
+        """Return the graph the queries are served from."""
+        snapshot = self._snapshot
+        return None if snapshot is None else snapshot.graph
+
+    @property
+    def poi_tables(self) -> Dict[float, PoiTable]:
+        """Return the precomputed POI tables of the current graph."""
+        snapshot = self._snapshot
+        return {} if snapshot is None else snapshot.poi_tables
+
+    @property
+    def contracted(self) -> Optional[ContractedGraph]:
+        """Return the contracted current graph."""
+        snapshot = self._snapshot
+        return None if snapshot is None else snapshot.contracted
 
     def add_trackpoints(self, trackpoints: List) -> None:
         """Add a list of trackpoints."""
-        self.trackpoints.extend(trackpoints)
-        self.graph = None
+        with self._lock:
+            if self.store is None:
+                self.trackpoints.extend(trackpoints)
+                if trackpoints:
+                    timestamps = [timestamp for timestamp, _, _ in trackpoints]
+                    self._batches.append(
+                        TrackBatch(
+                            self._batch_count,
+                            utc_timestamp(min(timestamps)),
+                            utc_timestamp(max(timestamps)),
+                            list(trackpoints),
+                        )
+                    )
+                    self._batch_count += 1
+            else:
+                self.store.append(trackpoints)
+            self._modified()
 
     def add_waypoints(self, waypoints: List) -> None:
         """Add a list of waypoints."""
-        self.waypoints.extend(waypoints)
-        self.graph = None
+        with self._lock:
+            self.waypoints.extend(waypoints)
+            self._modified()
 
     def add_gpx(self, track_xml: str) -> None:
         """Add a GPX XML file content."""
@@ -53,30 +196,234 @@ class World:
         if waypoints:
             self.add_waypoints(waypoints)
 
+    def _modified(self) -> None:
+        """Outdate the graph, rebuild it in the background if wanted.
+
+        Call with the lock held, together with the modification: a rebuild
+        copying the modified data must not get the previous version.
+        """
+        self._version += 1
+        if not self.background:
+            self._snapshot = None
+            return
+        # one queued rebuild will pick up all the modifications so far
+        if self._rebuild_queued:
+            return
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(
+                max_workers=1, thread_name_prefix="pygohome-rebuild"
+            )
+        self._rebuild_queued = True
+        self._rebuild = self._executor.submit(self._rebuild_snapshot)
+
+    def _rebuild_snapshot(self) -> None:
+        """Build a snapshot from a copy of the data and publish it."""
+        with self._lock:
+            self._rebuild_queued = False
+            version = self._version
+            trackpoints = list(self.trackpoints)
+            waypoints = list(self.waypoints)
+            batches = list(self._batches)
+            files = None if self.store is None else self.store.files()
+        try:
+            snapshot = self._build_snapshot(
+                version, trackpoints, waypoints, batches, files
+            )
+        except Exception as error:
+            # serving the old snapshot would hide the error forever
+            with self._lock:
+                if self._snapshot is None or self._snapshot.version < version:
+                    self._rebuild_error = (version, error)
+            return
+        with self._lock:
+            if self._snapshot is None or self._snapshot.version < version:
+                # a single assignment, readers hold the old snapshot
+                self._snapshot = snapshot
+                error = self._rebuild_error
+                if error is not None and error[0] < version:
+                    self._rebuild_error = None
+
+    def wait_for_rebuild(self) -> None:
+        """Block until the last background rebuild is published.
+
+        Raise the error of the last failed rebuild if none succeeded since.
+        """
+        rebuild = self._rebuild
+        if rebuild is not None:
+            rebuild.result()
+        self._raise_rebuild_error()
+
+    def _raise_rebuild_error(self) -> None:
+        """Raise the error of the last failed background rebuild."""
+        error = self._rebuild_error
+        if error is not None:
+            raise error[1]
+
+    def _build_snapshot(
+        self,
+        version: int,
+        trackpoints: List[Tuple[dt.datetime, float, float]],
+        waypoints: List[Tuple[str, float, float]],
+        batches: List[TrackBatch],
+        files: Optional[List[str]] = None,
+    ) -> Snapshot:
+        """Build the graph and everything precomputed from it.
+
+        The store is read only from the `files` listed with the version,
+        appends running meanwhile belong to the next version.
+        """
+        dfr_waypoints = prepare_waypoints(waypoints)
+        start = None
+        if self.window is not None:
+            start = utc_timestamp(dt.datetime.now(dt.timezone.utc))
+            start -= self.window
+        parts: Iterable[Tuple[pd.DataFrame, int]]
+        if self.store is not None:
+            parts = (
+                self._batch_encounters(dfr_trackpoints, dfr_waypoints)
+                for dfr_trackpoints in self.store.batches(
+                    start=start, files=files
+                )
+            )
+        elif start is None:
+            parts = [
+                self._batch_encounters(
+                    prepare_trackpoints(trackpoints), dfr_waypoints
+                )
+            ]
+        else:
+            # batches leaving the window never come back into it
+            with self._lock:
+                self._batches = [
+                    batch for batch in self._batches if batch.last >= start
+                ]
+            parts = self._window_encounters(batches, start, dfr_waypoints)
+        dfr_encounters = self._join_encounters(parts)
+        graph = build_graph(dfr_encounters, dfr_waypoints)
+        poi_tables = {
+            quantile: build_poi_table(graph, quantile)
+            for quantile in self.poi_quantiles
+        }
+        contracted = None
+        if self.contraction_quantile is not None:
+            contracted = contract_graph(graph, self.contraction_quantile)
+        return Snapshot(version, graph, poi_tables, contracted)
+
+    def _batch_encounters(
+        self, dfr_trackpoints: pd.DataFrame, dfr_waypoints: pd.DataFrame
+    ) -> Tuple[pd.DataFrame, int]:
+        """Find the encounters of a batch, return them with its segments."""
+        if set(dfr_trackpoints["utm_zone"]) != set(dfr_waypoints["utm_zone"]):
+            raise RegionTooLargeError(
+                f"Trackpoints ({dfr_trackpoints['utm_zone']!r}) and "
+                f"waypoints ({dfr_waypoints['utm_zone']!r}) "
+                f"in different UTM_zones."
+            )
+        segments = dfr_trackpoints["segment"].max() + 1
+        if self.interpolate:
+            return match_encounters(dfr_trackpoints, dfr_waypoints), segments
+        if self.downsample is not None:
+            dfr_trackpoints = downsample_trackpoints(
+                dfr_trackpoints, dfr_waypoints, max_error=self.downsample
+            )
+        return find_encounters(dfr_trackpoints, dfr_waypoints), segments
+
+    def _window_encounters(
+        self,
+        batches: List[TrackBatch],
+        start: pd.Timestamp,
+        dfr_waypoints: pd.DataFrame,
+    ) -> Iterator[Tuple[pd.DataFrame, int]]:
+        """Find the encounters of the batches recorded since start.
+
+        Batches completely within the window are processed only once,
+        the one overlapping its start is cut and processed every time.
+        The encounters of batches older than the window are evicted.
+        """
+        # new waypoints or settings make all the found encounters invalid
+        key = (tuple(dfr_waypoints.index), self.downsample, self.interpolate)
+        if key != self._encounter_cache_key:
+            self._encounter_cache = {}
+            self._encounter_cache_key = key
+        for batch in batches:
+            if batch.last < start:
+                self._encounter_cache.pop(batch.num, None)
+                continue
+            if batch.first < start:
+                yield self._batch_encounters(
+                    prepare_trackpoints(
+                        [
+                            point
+                            for point in batch.trackpoints
+                            if utc_timestamp(point[0]) >= start
+                        ]
+                    ),
+                    dfr_waypoints,
+                )
+                continue
+            if batch.num not in self._encounter_cache:
+                self._encounter_cache[batch.num] = self._batch_encounters(
+                    prepare_trackpoints(batch.trackpoints), dfr_waypoints
+                )
+            yield self._encounter_cache[batch.num]
+
+    @staticmethod
+    def _join_encounters(
+        parts: Iterable[Tuple[pd.DataFrame, int]],
+    ) -> pd.DataFrame:
+        """Join the encounters of batches, keep their segments apart."""
+        encounters = []
+        segments = 0
+        for dfr_encounters, batch_segments in parts:
+            encounters.append(
+                dfr_encounters.assign(
+                    segment=dfr_encounters["segment"] + segments
+                )
+            )
+            segments += batch_segments
+        if not encounters:
+            raise EmptyDataError("Trackpoints are empty.")
+        return pd.concat(encounters, ignore_index=True)
+
+    def _ensure_snapshot(self) -> Snapshot:
+        """Return the snapshot to serve a query from, build it if needed."""
+        self._raise_rebuild_error()
+        snapshot = self._snapshot
+        if snapshot is not None:
+            return snapshot
+        if self.background and self._rebuild is not None:
+            self._rebuild.result()
+            self._raise_rebuild_error()
+            snapshot = self._snapshot
+        if snapshot is None:
+            with self._lock:
+                version = self._version
+                files = None if self.store is None else self.store.files()
+            snapshot = self._build_snapshot(
+                version, self.trackpoints, self.waypoints, self._batches, files
+            )
+            self._snapshot = snapshot
+        return snapshot
+
     def _ensure_graph(self) -> None:
         """Rebuild graph if needed."""
-        if self.graph is None:
-            dfr_trackpoints = prepare_trackpoints(self.trackpoints)
-            dfr_waypoints = prepare_waypoints(self.waypoints)
-            if set(dfr_trackpoints["utm_zone"]) != set(
-                dfr_waypoints["utm_zone"]
-            ):
-                raise RegionTooLargeError(
-                    f"Trackpoints ({dfr_trackpoints['utm_zone']!r}) and "
-                    f"waypoints ({dfr_waypoints['utm_zone']!r}) "
-                    f"in different UTM_zones."
-                )
-            dfr_encounters = find_encounters(dfr_trackpoints, dfr_waypoints)
-            self.graph = build_graph(dfr_encounters, dfr_waypoints)
+        self._ensure_snapshot()
 
     def fastest_path(
         self, src: str, dst: str, quantile: float = 0.8
     ) -> nx.Graph:
         """Find the shortest path between src and dst with quantile prob."""
-        self._ensure_graph()
+        snapshot = self._ensure_snapshot()
+        table = snapshot.poi_tables.get(quantile)
+        if table is not None and src in table.pois and dst in table.index:
+            return nx.path_graph(table_path(table, src, dst))
+        contracted = snapshot.contracted
+        if contracted is not None and contracted.quantile == quantile:
+            if src in contracted.core and dst in contracted.core:
+                return nx.path_graph(contracted_path(contracted, src, dst))
         path = nx.path_graph(
             nx.dijkstra_path(
-                self.graph,
+                snapshot.graph,
                 src,
                 dst,
                 lambda u, v, a: np.quantile(a["secs"], quantile),
@@ -84,14 +431,52 @@ class World:
         )
         return path
 
+    def quantile_sweep(
+        self, src: str, dst: str, quantiles: Sequence[float]
+    ) -> List[SweepRun]:
+        """Find the fastest paths for many quantiles in one go.
+
+        Return runs of consecutive quantiles sharing the same path
+        with the period of the path for each of the quantiles.
+        """
+        snapshot = self._ensure_snapshot()
+        return [
+            run._replace(path=nx.path_graph(run.path))
+            for run in quantile_sweep(snapshot.graph, src, dst, quantiles)
+        ]
+
+    def alternative_paths(
+        self,
+        src: str,
+        dst: str,
+        quantile: float = 0.8,
+        k: int = 3,
+        max_detour: float = 1.5,
+    ) -> List[Tuple[float, nx.Graph]]:
+        """Find up to k fastest paths through different places.
+
+        Return pairs of the quantile period and the path, fastest first.
+        """
+        snapshot = self._ensure_snapshot()
+        return [
+            (period, nx.path_graph(path))
+            for period, path in alternative_paths(
+                snapshot.graph, src, dst, quantile, k, max_detour
+            )
+        ]
+
     def single_source_periods(self, src: str, quantile: float = 0.8) -> Dict:
         """Return periods to every other waypoint from the src."""
-        self._ensure_graph()
-        all_dsts_periods = nx.single_source_dijkstra(
-            self.graph,
-            src,
-            weight=lambda u, v, a: int(np.quantile(a["secs"], quantile)),
-        )[0]
+        snapshot = self._ensure_snapshot()
+        table = snapshot.poi_tables.get(quantile)
+        if table is not None and src in table.pois:
+            all_dsts_periods = table_periods(table, src)
+        else:
+            all_dsts_periods = nx.single_source_dijkstra(
+                snapshot.graph,
+                src,
+                weight=lambda u, v, a: int(np.quantile(a["secs"], quantile)),
+            )[0]
         periods: Dict = {}
         for dst, period in all_dsts_periods.items():
             if isinstance(dst, tuple):
@@ -103,3 +488,31 @@ class World:
             else:
                 periods[dst] = period
         return periods
+
+    def route_distribution(
+        self,
+        path: Iterable[Hashable],
+        samples: int = 1000,
+        quantiles: Sequence[float] = (0.5, 0.8),
+        bands: Sequence[float] = (0.5, 0.9),
+        seed: Optional[int] = None,
+    ) -> RouteDistribution:
+        """Simulate the total period of a path, e.g. from fastest_path."""
+        return self.route_distributions(
+            [path], samples, quantiles, bands, seed
+        )[0]
+
+    def route_distributions(
+        self,
+        paths: Iterable[Iterable[Hashable]],
+        samples: int = 1000,
+        quantiles: Sequence[float] = (0.5, 0.8),
+        bands: Sequence[float] = (0.5, 0.9),
+        seed: Optional[int] = None,
+    ) -> List[RouteDistribution]:
+        """Simulate the total periods of many paths in one batch."""
+        snapshot = self._ensure_snapshot()
+        totals = sample_periods(
+            snapshot.graph, [list(path) for path in paths], samples, seed
+        )
+        return describe_periods(totals, quantiles, bands)
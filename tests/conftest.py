@@ -0,0 +1,59 @@
+"""Pytest configuration: the performance tier runs only with --perf."""
+
+import json
+import platform
+from pathlib import Path
+from typing import Any, Dict, Iterator, List
+
+import pytest
+
+import pygohome
+
+
+def pytest_addoption(parser: Any) -> None:
+    """Add the options of the performance tier."""
+    parser.addoption(
+        "--perf", action="store_true", help="run the performance tests"
+    )
+    parser.addoption(
+        "--perf-report",
+        default=None,
+        help="write the performance results as JSON to this file",
+    )
+
+
+def pytest_configure(config: Any) -> None:
+    """Register the perf marker."""
+    config.addinivalue_line(
+        "markers", "perf: performance test at scale, run with --perf"
+    )
+
+
+def pytest_collection_modifyitems(config: Any, items: List[Any]) -> None:
+    """Skip the performance tests unless asked for."""
+    if config.getoption("--perf"):
+        return
+    skip = pytest.mark.skip(reason="performance test, run with --perf")
+    for item in items:
+        if "perf" in item.keywords:
+            item.add_marker(skip)
+
+
+@pytest.fixture(scope="session")
+def perf_report(request: Any) -> Iterator[List[Dict]]:
+    """Collect the performance results, write them at the end."""
+    results: List[Dict] = []
+    yield results
+    path = request.config.getoption("--perf-report")
+    if path and results:
+        Path(path).write_text(
+            json.dumps(
+                {
+                    "pygohome": pygohome.__version__,
+                    "python": platform.python_version(),
+                    "implementation": platform.python_implementation(),
+                    "results": results,
+                },
+                indent=2,
+            )
+        )
@@ -0,0 +1,85 @@
+"""Test the coverage module."""
+
+import networkx as nx
+import numpy as np
+import pandas as pd
+import pytest
+
+import pygohome.coverage as coverage
+
+
+@pytest.fixture
+def graph() -> nx.DiGraph:
+    """Create a graph with a slow intersection."""
+    graph = nx.DiGraph()
+    graph.add_node("alice", latitude=49.0, longitude=8.4)
+    graph.add_node(("2", "alice", "2"), latitude=49.001, longitude=8.401)
+    graph.add_node(("2", "2", "bob"), latitude=49.001, longitude=8.401)
+    graph.add_node("bob", latitude=49.002, longitude=8.402)
+    graph.add_edge("alice", ("2", "alice", "2"), secs=[3, 5, 9])
+    graph.add_edge(("2", "alice", "2"), ("2", "2", "bob"), secs=[40])
+    graph.add_edge(("2", "2", "bob"), "bob", secs=[3, 4, 6, 8])
+    return graph
+
+
+def test_edge_coverage(graph: nx.DiGraph) -> None:
+    """Edges get their counts and medians, inner edges are left out."""
+    result = coverage.edge_coverage(graph)
+    expected = pd.DataFrame(
+        {
+            "src_latitude": [49.0, 49.001],
+            "src_longitude": [8.4, 8.401],
+            "dst_latitude": [49.001, 49.002],
+            "dst_longitude": [8.401, 8.402],
+            "count": [3, 4],
+            "median": [5.0, 5.0],
+        }
+    )
+    pd.testing.assert_frame_equal(result, expected)
+
+
+def test_simplify_edges(graph: nx.DiGraph) -> None:
+    """Short edges disappear when zooming out."""
+    edges = coverage.edge_coverage(graph)
+    assert len(coverage.simplify_edges(edges, 18)) == 2
+    assert coverage.simplify_edges(edges, 18)["count"].sum() == 7
+    assert len(coverage.simplify_edges(edges, 5)) == 0
+
+
+def test_simplify_edges_bounds(graph: nx.DiGraph) -> None:
+    """Only edges overlapping the bounds are kept."""
+    edges = coverage.edge_coverage(graph)
+    result = coverage.simplify_edges(
+        edges, 18, bounds=((49.0015, 8.0), (49.1, 9.0))
+    )
+    assert list(result["count"]) == [4]
+    result = coverage.simplify_edges(edges, 18, bounds=((0, 0), (1, 1)))
+    assert len(result) == 0
+
+
+def test_heat_points() -> None:
+    """Points are counted in cells and weighted relative to the maximum."""
+    latitude = np.array([49.0, 49.0, 49.0, 49.5])
+    longitude = np.array([8.4, 8.4, 8.4, 8.5])
+    result = coverage.heat_points(latitude, longitude, 14)
+    assert result.shape == (2, 3)
+    assert list(result[:, 2]) == pytest.approx([1.0, 1 / 3])
+    assert result[0, :2] == pytest.approx([49.0, 8.4], abs=0.001)
+    result = coverage.heat_points(
+        latitude, longitude, 14, bounds=((49.4, 8.0), (49.6, 9.0))
+    )
+    assert list(result[:, 2]) == [1.0]
+    result = coverage.heat_points(
+        latitude, longitude, 14, bounds=((0, 0), (1, 1))
+    )
+    assert result.shape == (0, 3)
+
+
+def test_colors() -> None:
+    """Lowest values are blue and the highest red."""
+    assert list(coverage.colors([1, 3, 2])) == [
+        "#0040ff",
+        "#ff4000",
+        "#7f4080",
+    ]
+    assert list(coverage.colors([5])) == ["#0040ff"]
@@ -0,0 +1,227 @@
+"""Test the routing latency and memory at scale.
+
+Run with `python -m pytest --perf --perf-report perf.json`.
+Every tier runs in a fresh process, so its peak memory is its own.
+The p99 is the nearest-rank one: with up to 100 queries the slowest.
+"""
+
+import datetime as dt
+import math
+import multiprocessing
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Dict, List, Tuple
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from pygohome.routing import is_poi
+from pygohome.world import World
+
+resource = pytest.importorskip("resource")
+
+# grid side, walks of 60 intersections, budgets in seconds and MB;
+# about 10k and 100k nodes including the slow intersection sub-nodes
+TIERS = {
+    "10k": {
+        "side": 75,
+        "walks": 1200,
+        "queries": 20,
+        "build": 10,
+        "fastest_path_p50": 2,
+        "fastest_path_p99": 5,
+        "single_source_periods_p50": 4,
+        "single_source_periods_p99": 8,
+        "peak_rss_mb": 600,
+    },
+    "100k": {
+        "side": 235,
+        "walks": 22000,
+        "queries": 5,
+        "build": 120,
+        "fastest_path_p50": 15,
+        "fastest_path_p99": 40,
+        "single_source_periods_p50": 45,
+        "single_source_periods_p99": 90,
+        "peak_rss_mb": 2500,
+    },
+}
+
+
+def make_city(
+    side: int, walks: int, steps: int = 60, seed: int = 0
+) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """Generate encounters of random walks through a grid city.
+
+    Every 97th intersection is a POI, every 10th one is slow.
+    """
+    rng = np.random.default_rng(seed)
+    nums = np.arange(side * side)
+    names = np.where(
+        nums % 97 == 0, np.char.add("poi", nums.astype(str)), nums.astype(str)
+    ).astype(object)
+    dfr_waypoints = pd.DataFrame(
+        {
+            "latitude": 49.0 + nums // side * 0.001,
+            "longitude": 8.4 + nums % side * 0.0015,
+        },
+        index=pd.Index(names, name="name"),
+    )
+    is_slow = rng.random(len(nums)) < 0.1
+
+    # walk one block at a time, turn back at the border of the city
+    moves = np.array([(0, 1), (0, -1), (1, 0), (-1, 0)])
+    row, col = rng.integers(0, side, walks), rng.integers(0, side, walks)
+    positions = [row * side + col]
+    for _ in range(steps - 1):
+        move = moves[rng.integers(0, 4, walks)]
+        new_row, new_col = row + move[:, 0], col + move[:, 1]
+        is_outside = (new_row < 0) | (new_row >= side)
+        is_outside |= (new_col < 0) | (new_col >= side)
+        row = np.where(is_outside, row - move[:, 0], new_row)
+        col = np.where(is_outside, col - move[:, 1], new_col)
+        positions.append(row * side + col)
+    nodes = np.column_stack(positions)
+
+    travel = rng.integers(20, 90, nodes.shape)
+    travel[:, 0] = 0
+    dwell = np.where(
+        is_slow[nodes],
+        rng.integers(15, 60, nodes.shape),
+        rng.integers(0, 10, nodes.shape),
+    )
+    end = np.cumsum(travel + dwell, axis=1)
+    dfr_encounters = pd.DataFrame(
+        {
+            "segment": np.repeat(np.arange(walks), steps),
+            "start": (end - dwell).ravel(),
+            "end": end.ravel(),
+            "node": names[nodes.ravel()],
+        }
+    )
+    return dfr_encounters, dfr_waypoints
+
+
+def make_trackpoints(
+    dfr_encounters: pd.DataFrame, dfr_waypoints: pd.DataFrame
+) -> List[Tuple[dt.datetime, float, float]]:
+    """Turn the encounters into trackpoints finding them again.
+
+    A point at the start and the end of every encounter, one halfway
+    to the next waypoint of the walk; the walks start 3 hours apart.
+    """
+    latitude = dfr_waypoints.loc[dfr_encounters["node"], "latitude"]
+    longitude = dfr_waypoints.loc[dfr_encounters["node"], "longitude"]
+    segment = dfr_encounters["segment"].to_numpy()
+    start = dfr_encounters["start"].to_numpy()
+    end = dfr_encounters["end"].to_numpy()
+    nxt = np.flatnonzero(segment[1:] == segment[:-1]) + 1
+    prev = nxt - 1
+
+    def with_halfway(values: np.ndarray) -> np.ndarray:
+        return np.concatenate(
+            [values, values, (values[prev] + values[nxt]) / 2]
+        )
+
+    secs = np.concatenate([start, end, (end[prev] + start[nxt]) / 2])
+    secs += np.concatenate([segment, segment, segment[nxt]]) * 3 * 3600
+    order = np.argsort(secs, kind="stable")
+    timestamps = pd.Timestamp("2020-05-01", tz="UTC") + pd.to_timedelta(
+        secs[order], unit="s"
+    )
+    return list(
+        zip(
+            timestamps.to_pydatetime(),
+            with_halfway(latitude.to_numpy())[order].tolist(),
+            with_halfway(longitude.to_numpy())[order].tolist(),
+        )
+    )
+
+
+def peak_rss_mb() -> float:
+    """Return the peak resident memory of this process in MB."""
+    # bytes on macOS, kilobytes elsewhere
+    unit = 1024 * 1024 if sys.platform == "darwin" else 1024
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / unit
+
+
+def latencies(query: Callable, args: List[Tuple]) -> Dict[str, float]:
+    """Run the query for each args, return p50 and p99 in seconds."""
+    times = []
+    for arg in args:
+        start = time.perf_counter()
+        query(*arg)
+        times.append(time.perf_counter() - start)
+    times.sort()
+    return {
+        "p50": float(np.median(times)),
+        "p99": times[math.ceil(0.99 * len(times)) - 1],
+    }
+
+
+def run_tier(tier: str) -> Dict:
+    """Build a world from the walks of the tier and time its queries."""
+    budget = TIERS[tier]
+    dfr_encounters, dfr_waypoints = make_city(budget["side"], budget["walks"])
+    trackpoints = make_trackpoints(dfr_encounters, dfr_waypoints)
+    waypoints = list(
+        zip(
+            dfr_waypoints.index,
+            dfr_waypoints["latitude"],
+            dfr_waypoints["longitude"],
+        )
+    )
+
+    world = World(background=True)
+    start = time.perf_counter()
+    world.add_waypoints(waypoints)
+    world.add_trackpoints(trackpoints)
+    world.wait_for_rebuild()
+    build = time.perf_counter() - start
+
+    graph = world.graph
+    pois = sorted(node for node in graph if is_poi(node))
+    rng = np.random.default_rng(1)
+    pairs = [
+        tuple(rng.choice(pois, 2, replace=False))
+        for _ in range(budget["queries"])
+    ]
+    fastest_path = latencies(world.fastest_path, pairs)
+    single_source_periods = latencies(
+        world.single_source_periods, [pair[:1] for pair in pairs]
+    )
+
+    return {
+        "tier": tier,
+        "nodes": graph.number_of_nodes(),
+        "edges": graph.number_of_edges(),
+        "tuple_nodes": sum(isinstance(node, tuple) for node in graph),
+        "build": build,
+        "fastest_path_p50": fastest_path["p50"],
+        "fastest_path_p99": fastest_path["p99"],
+        "single_source_periods_p50": single_source_periods["p50"],
+        "single_source_periods_p99": single_source_periods["p99"],
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+@pytest.mark.perf
+@pytest.mark.parametrize("tier", TIERS)
+def test_routing_at_scale(tier: str, perf_report: List[Dict]) -> None:
+    """Build a large graph and query it within the budgets."""
+    budget = TIERS[tier]
+    with ProcessPoolExecutor(
+        max_workers=1, mp_context=multiprocessing.get_context("spawn")
+    ) as executor:
+        result = executor.submit(run_tier, tier).result()
+    perf_report.append(result)
+
+    assert result["tuple_nodes"] > 0
+    over_budget = {
+        key: (value, budget[key])
+        for key, value in result.items()
+        if key in budget and value > budget[key]
+    }
+    assert not over_budget
@@ -112,3 +112,132 @@ def test_prepare_waypoints_too_far_away_fails() -> None:
     waypoints = [("east", 49.00, 8.40), ("west", 49.00, -8.40)]
     with pytest.raises(processor.RegionTooLargeError):
         processor.prepare_waypoints(waypoints)
+
+
+@pytest.fixture
+def long_track() -> pd.DataFrame:
+    """Create a 1 Hz track of 2000 points going north at 5 m/s."""
+    start = dt.datetime(2020, 5, 1, tzinfo=dt.timezone.utc)
+    trackpoints = [
+        (start + dt.timedelta(seconds=secs), 49.0 + secs * 0.000045, 8.4)
+        for secs in range(2000)
+    ]
+    return processor.prepare_trackpoints(trackpoints)
+
+
+@pytest.fixture
+def long_track_waypoints() -> pd.DataFrame:
+    """Create waypoints along the long track."""
+    return processor.prepare_waypoints(
+        [("home", 49.0, 8.4), ("1", 49.03, 8.4), ("work", 49.08, 8.4)]
+    )
+
+
+def test_downsample_trackpoints_exact(
+    long_track: pd.DataFrame, long_track_waypoints: pd.DataFrame
+) -> None:
+    """Dropping points far away keeps the encounters unchanged."""
+    result = processor.downsample_trackpoints(long_track, long_track_waypoints)
+    assert len(result) < len(long_track) / 5
+    pd.testing.assert_frame_equal(
+        processor.find_encounters(result, long_track_waypoints),
+        processor.find_encounters(long_track, long_track_waypoints),
+    )
+
+
+def test_downsample_trackpoints_max_error(
+    long_track: pd.DataFrame, long_track_waypoints: pd.DataFrame
+) -> None:
+    """Thinning points near waypoints keeps the encounters unchanged."""
+    exact = processor.find_encounters(long_track, long_track_waypoints)
+    result = processor.downsample_trackpoints(
+        long_track, long_track_waypoints, max_error=2
+    )
+    assert len(result) < len(long_track) / 15
+    approx = processor.find_encounters(result, long_track_waypoints)
+    assert list(exact["node"]) == ["home", "1", "work"]
+    pd.testing.assert_frame_equal(approx, exact)
+
+
+def test_downsample_trackpoints_short_encounter() -> None:
+    """Encounters shorter than the thinning are kept."""
+    start = dt.datetime(2020, 5, 1, tzinfo=dt.timezone.utc)
+    track = processor.prepare_trackpoints(
+        [
+            (start + dt.timedelta(seconds=secs), 49.0 + secs * 0.00009, 8.4)
+            for secs in range(400)
+        ]
+    )
+    # 10 m/s, within 30 m of "1" for 5 seconds only
+    waypoints = processor.prepare_waypoints(
+        [("a", 49.0, 8.4), ("1", 49.00927, 8.4), ("b", 49.027, 8.4)]
+    )
+    exact = processor.find_encounters(track, waypoints)
+    result = processor.downsample_trackpoints(track, waypoints, max_error=9)
+    assert len(result) < len(track) / 10
+    assert list(exact["node"]) == ["a", "1", "b"]
+    pd.testing.assert_frame_equal(
+        processor.find_encounters(result, waypoints), exact
+    )
+
+
+def test_downsample_trackpoints_fast_track() -> None:
+    """Blocks moving fast near a waypoint are kept whole."""
+    start = dt.datetime(2020, 5, 1, tzinfo=dt.timezone.utc)
+    track = processor.prepare_trackpoints(
+        [
+            (start + dt.timedelta(seconds=secs), 49.0 + secs * 0.00027, 8.4)
+            for secs in range(200)
+        ]
+    )
+    # 30 m/s, the first waypoint is 290 m from the first point
+    waypoints = processor.prepare_waypoints(
+        [("fast", 49.0 + 0.00027 * 9.7, 8.4), ("far", 49.027, 8.4)]
+    )
+    result = processor.downsample_trackpoints(track, waypoints)
+    assert len(result) < len(track) / 2
+    pd.testing.assert_frame_equal(
+        processor.find_encounters(result, waypoints),
+        processor.find_encounters(track, waypoints),
+    )
+
+
+def test_match_encounters_dense(
+    long_track: pd.DataFrame, long_track_waypoints: pd.DataFrame
+) -> None:
+    """On a dense track the lines give about the same encounters."""
+    exact = processor.find_encounters(long_track, long_track_waypoints)
+    result = processor.match_encounters(long_track, long_track_waypoints)
+    assert list(result["node"]) == list(exact["node"])
+    assert (
+        result[["start", "end"]] - exact[["start", "end"]]
+    ).abs().max().max() <= 1
+
+
+def test_match_encounters_sparse(
+    long_track: pd.DataFrame, long_track_waypoints: pd.DataFrame
+) -> None:
+    """Waypoints between sparse trackpoints are still encountered."""
+    exact = processor.match_encounters(long_track, long_track_waypoints)
+    sparse = long_track.iloc[::15].reset_index(drop=True)
+    assert len(processor.find_encounters(sparse, long_track_waypoints)) < 3
+    result = processor.match_encounters(sparse, long_track_waypoints)
+    assert list(result["node"]) == ["home", "1", "work"]
+    assert (
+        result[["start", "end"]] - exact[["start", "end"]]
+    ).abs().max().max() <= 1
+
+
+def test_match_encounters_close_waypoints(long_track: pd.DataFrame) -> None:
+    """Waypoints closer than 2 * max_dist split the track between them."""
+    waypoints = processor.prepare_waypoints(
+        [("home", 49.0, 8.4), ("1", 49.03, 8.4), ("2", 49.03036, 8.4)]
+    )
+    exact = processor.find_encounters(long_track, waypoints)
+    sparse = long_track.iloc[::15].reset_index(drop=True)
+    result = processor.match_encounters(sparse, waypoints)
+    assert list(result["node"]) == list(exact["node"]) == ["home", "1", "2"]
+    assert result.iloc[1]["end"] == result.iloc[2]["start"]
+    assert (
+        result[["start", "end"]] - exact[["start", "end"]]
+    ).abs().max().max() <= 1
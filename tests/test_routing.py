@@ -0,0 +1,215 @@
+"""Test the routing module."""
+
+import itertools
+
+import networkx as nx
+import numpy as np
+import pytest
+
+import pygohome.routing as routing
+
+
+@pytest.fixture
+def graph() -> nx.DiGraph:
+    """Create a graph with two routes from alice to bob."""
+    graph = nx.DiGraph()
+    graph.add_edge("alice", "1", secs=[10, 20])
+    graph.add_edge("1", "bob", secs=[10, 10])
+    graph.add_edge("alice", "bob", secs=[15, 40])
+    graph.add_edge("bob", "carol", secs=[5])
+    graph.add_node("dave")
+    return graph
+
+
+@pytest.mark.parametrize(
+    "node, expected",
+    [("alice", True), ("1", False), (("1", "alice", "1"), False), (1, False)],
+)
+def test_is_poi(node: object, expected: bool) -> None:
+    """Only named nodes are POIs."""
+    assert routing.is_poi(node) is expected
+
+
+def test_edge_weights(graph: nx.DiGraph) -> None:
+    """Each edge gets the quantile of its secs."""
+    weights = routing.edge_weights(graph, 0.5)
+    assert weights == {
+        ("alice", "1"): 15,
+        ("alice", "bob"): 27.5,
+        ("1", "bob"): 10,
+        ("bob", "carol"): 5,
+    }
+
+
+@pytest.mark.parametrize("quantile", [0.0, 0.5, 1.0])
+def test_poi_table_matches_dijkstra(
+    graph: nx.DiGraph, quantile: float
+) -> None:
+    """Table lookups equal the searches on the graph."""
+    table = routing.build_poi_table(graph, quantile)
+    assert set(table.pois) == {"alice", "bob", "carol", "dave"}
+    weights = routing.edge_weights(graph, quantile)
+    for src in table.pois:
+        periods = nx.single_source_dijkstra_path_length(
+            graph, src, weight=lambda u, v, a: int(weights[u, v])
+        )
+        assert routing.table_periods(table, src) == periods
+        for dst in periods:
+            assert routing.table_path(table, src, dst) == nx.dijkstra_path(
+                graph, src, dst, weight=lambda u, v, a: weights[u, v]
+            )
+
+
+def test_table_path_no_path(graph: nx.DiGraph) -> None:
+    """Unreachable destination raises like networkx does."""
+    table = routing.build_poi_table(graph, 0.5)
+    with pytest.raises(nx.NetworkXNoPath):
+        routing.table_path(table, "alice", "dave")
+
+
+@pytest.fixture
+def city() -> nx.DiGraph:
+    """Create a grid city with POIs at the border and slow intersections."""
+    rng = np.random.default_rng(42)
+    grid = nx.grid_2d_graph(8, 8).to_directed()
+    names = {
+        node: f"poi{num}" if 0 in node else str(num)
+        for num, node in enumerate(grid)
+    }
+    graph = nx.DiGraph()
+    for u, v in grid.edges:
+        graph.add_edge(
+            names[u], names[v], secs=sorted(rng.integers(10, 60, size=5))
+        )
+    # turn one intersection into a slow one with tuple sub-nodes
+    here = names[4, 4]
+    preds, succs = list(graph.pred[here]), list(graph.succ[here])
+    for pred in preds:
+        graph.add_edge(pred, (here, pred, here), **graph[pred][here])
+        for succ in succs:
+            if succ != pred:
+                graph.add_edge(
+                    (here, pred, here), (here, here, succ), secs=[5, 30]
+                )
+    for succ in succs:
+        graph.add_edge((here, here, succ), succ, **graph[here][succ])
+    graph.remove_node(here)
+    return graph
+
+
+@pytest.mark.parametrize("quantile", [0.2, 0.8])
+def test_contracted_path_same_periods(
+    city: nx.DiGraph, quantile: float
+) -> None:
+    """Contracted searches find paths as fast as the full search."""
+    contracted = routing.contract_graph(city, quantile)
+    assert contracted.core.number_of_nodes() < city.number_of_nodes()
+    weights = routing.edge_weights(city, quantile)
+    pois = [node for node in city if routing.is_poi(node)]
+    assert set(pois) <= set(contracted.core)
+    for src in pois:
+        lengths = nx.single_source_dijkstra_path_length(
+            city, src, weight=lambda u, v, a: weights[u, v]
+        )
+        for dst in pois:
+            path = routing.contracted_path(contracted, src, dst)
+            assert path[0] == src and path[-1] == dst
+            assert sum(
+                weights[u, v] for u, v in zip(path, path[1:])
+            ) == pytest.approx(lengths[dst])
+
+
+def test_sample_periods(graph: nx.DiGraph) -> None:
+    """Totals are sums of recorded secs, one row per path."""
+    paths = [["alice", "1", "bob"], ["alice", "bob", "carol"], ["dave"]]
+    totals = routing.sample_periods(graph, paths, 1000, seed=1)
+    assert totals.shape == (3, 1000)
+    assert set(totals[0]) == {20, 30}
+    assert set(totals[1]) == {20, 45}
+    assert set(totals[2]) == {0}
+    np.testing.assert_array_equal(
+        totals, routing.sample_periods(graph, paths, 1000, seed=1)
+    )
+
+
+def test_describe_periods() -> None:
+    """Quantiles and central bands are taken from each row."""
+    totals = np.array([np.arange(101), np.full(101, 7)])
+    result = routing.describe_periods(totals, [0.5], [0.9])
+    assert result[0].quantiles == {0.5: 50}
+    assert result[0].bands[0.9] == pytest.approx((5, 95))
+    assert result[1].quantiles == {0.5: 7}
+    assert result[1].bands == {0.9: (7, 7)}
+
+
+def test_alternative_paths(graph: nx.DiGraph) -> None:
+    """Both paths from alice to bob, the fastest first."""
+    result = routing.alternative_paths(graph, "alice", "bob", 0.5)
+    assert result == [(25, ["alice", "1", "bob"]), (27.5, ["alice", "bob"])]
+    result = routing.alternative_paths(graph, "alice", "bob", 0.5, k=1)
+    assert result == [(25, ["alice", "1", "bob"])]
+    result = routing.alternative_paths(
+        graph, "alice", "bob", 0.5, max_detour=1.05
+    )
+    assert result == [(25, ["alice", "1", "bob"])]
+    with pytest.raises(nx.NetworkXNoPath):
+        routing.alternative_paths(graph, "alice", "dave", 0.5)
+
+
+def test_alternative_paths_same_as_simple_paths(city: nx.DiGraph) -> None:
+    """Periods are the same as from the generic networkx algorithm."""
+    weights = routing.edge_weights(city, 0.8)
+    expected = [
+        routing._path_period(path, weights)
+        for path in itertools.islice(
+            nx.shortest_simple_paths(
+                city, "poi7", "poi56", weight=lambda u, v, a: weights[u, v]
+            ),
+            5,
+        )
+    ]
+    result = routing.alternative_paths(
+        city, "poi7", "poi56", 0.8, k=5, max_detour=10
+    )
+    assert [period for period, _ in result] == pytest.approx(expected)
+    for period, path in result:
+        assert routing._path_period(path, weights) == pytest.approx(period)
+
+
+def test_edge_quantiles_same_as_numpy(city: nx.DiGraph) -> None:
+    """The matrix has exactly the values of np.quantile."""
+    quantiles = np.linspace(0, 1, 21)
+    edges, weights = routing.edge_quantiles(city, quantiles)
+    assert weights.shape == (city.number_of_edges(), 21)
+    for edge, row in zip(edges, weights):
+        secs = city.edges[edge]["secs"]
+        assert list(row) == [np.quantile(secs, q) for q in quantiles]
+
+
+def test_quantile_sweep(graph: nx.DiGraph) -> None:
+    """Quantiles with the same path are merged into one run."""
+    runs = routing.quantile_sweep(graph, "alice", "bob", [0.0, 0.5, 1.0])
+    assert len(runs) == 2
+    assert list(runs[0].quantiles) == [0.0]
+    assert runs[0].path == ["alice", "bob"]
+    assert list(runs[0].periods) == [15]
+    assert list(runs[1].quantiles) == [0.5, 1.0]
+    assert runs[1].path == ["alice", "1", "bob"]
+    assert list(runs[1].periods) == [25, 30]
+
+
+def test_quantile_sweep_same_as_dijkstra(city: nx.DiGraph) -> None:
+    """Every quantile gets the path of a separate search."""
+    quantiles = np.linspace(0.05, 0.95, 19)
+    runs = routing.quantile_sweep(city, "poi7", "poi56", quantiles)
+    assert np.concatenate([run.quantiles for run in runs]) == pytest.approx(
+        quantiles
+    )
+    for run in runs:
+        for quantile, period in zip(run.quantiles, run.periods):
+            weights = routing.edge_weights(city, quantile)
+            path = nx.dijkstra_path(
+                city, "poi7", "poi56", weight=lambda u, v, a: weights[u, v]
+            )
+            assert run.path == path
+            assert routing._path_period(path, weights) == pytest.approx(period)
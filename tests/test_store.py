@@ -0,0 +1,94 @@
+"""Test the store module."""
+
+import datetime as dt
+from pathlib import Path
+
+import pandas as pd
+import pytest
+
+import pygohome.processor as processor
+from pygohome.world import World
+
+pytest.importorskip("pyarrow")
+
+from pygohome.store import TrackStore  # noqa: E402
+
+UTC = dt.timezone.utc
+TRACKPOINTS = [
+    (dt.datetime(2020, 5, 31, 23, 59, 50, 0, UTC), 49.00, 8.40),
+    (dt.datetime(2020, 6, 1, 0, 0, 5, 0, UTC), 49.01, 8.41),
+    (dt.datetime(2020, 6, 1, 1, 0, 0, 0, UTC), 49.00, 8.40),
+]
+
+
+def test_empty_store(tmp_path: Path) -> None:
+    """A new store has no batches."""
+    assert list(TrackStore(tmp_path / "store").batches()) == []
+
+
+def test_empty_store_time_range(tmp_path: Path) -> None:
+    """A new store has no batches in any time range."""
+    store = TrackStore(tmp_path)
+    start = dt.datetime(2020, 6, 1, 0, 0, 0, 0, UTC)
+    assert list(store.batches(start=start)) == []
+    assert list(store.batches(end=start)) == []
+
+
+def test_append_read(tmp_path: Path) -> None:
+    """An append crossing months is read back as a single batch."""
+    store = TrackStore(tmp_path)
+    store.append(TRACKPOINTS)
+    store.append([])
+    (result,) = store.batches()
+    pd.testing.assert_frame_equal(
+        result, processor.prepare_trackpoints(TRACKPOINTS)
+    )
+    assert len(list(tmp_path.glob("month=*/*.parquet"))) == 2
+
+
+def test_read_time_range(tmp_path: Path) -> None:
+    """Only the rows in the time range are read."""
+    store = TrackStore(tmp_path)
+    store.append(TRACKPOINTS[:2])
+    store.append(TRACKPOINTS[2:])
+    start = dt.datetime(2020, 6, 1, 0, 0, 0, 0, UTC)
+    end = dt.datetime(2020, 6, 1, 1, 0, 0, 0, UTC)
+    (result,) = store.batches(start, end)
+    pd.testing.assert_frame_equal(
+        result, processor.prepare_trackpoints(TRACKPOINTS[1:2])
+    )
+    assert len(list(store.batches(start=start))) == 2
+    assert len(list(store.batches(end=start))) == 1
+
+
+def test_read_pinned_files(tmp_path: Path) -> None:
+    """Appends after listing the files are not read."""
+    store = TrackStore(tmp_path)
+    store.append(TRACKPOINTS[:2])
+    files = store.files()
+    store.append(TRACKPOINTS[2:])
+    (result,) = store.batches(files=files)
+    pd.testing.assert_frame_equal(
+        result, processor.prepare_trackpoints(TRACKPOINTS[:2])
+    )
+    assert len(list(store.batches())) == 2
+
+
+def test_world_with_store(tmp_path: Path) -> None:
+    """A world with a store finds the same periods."""
+    waypoints = [("alice", 49.0000, 8.4000), ("bob", 49.0010, 8.4010)]
+    trackpoints = [
+        (dt.datetime(2020, 5, 1, 0, 0, secs, 0, UTC), lat, lon)
+        for secs, lat, lon in [
+            (0, 49.0001, 8.4001),
+            (3, 49.0005, 8.4005),
+            (6, 49.0009, 8.4009),
+        ]
+    ]
+    world = World(store=TrackStore(tmp_path))
+    world.add_waypoints(waypoints)
+    world.add_trackpoints(trackpoints)
+    world.add_trackpoints(trackpoints)
+    assert world.trackpoints == []
+    assert world.single_source_periods("alice") == {"alice": 0, "bob": 6}
+    assert sorted(world.graph.edges["alice", "bob"]["secs"]) == [6, 6]
@@ -1,11 +1,13 @@
 """Test the world module."""
 
 import datetime as dt
+import threading
 from pathlib import Path
+from typing import Any, List, Tuple
 
 import pytest
 
-from pygohome.world import RegionTooLargeError, World
+from pygohome.world import RegionTooLargeError, Snapshot, World
 
 
 def test_no_trackpoints() -> None:
@@ -214,3 +216,201 @@ def test_single_source_periods_with_slow(world2: World) -> None:
     """Find period to every other waypoint from the src with a slow node."""
     result = world2.single_source_periods("alice")
     assert result == {"alice": 0, "2": 3, "bob": 56}
+
+
+@pytest.mark.parametrize("world", ["world1", "world2"])
+def test_poi_tables_same_results(world: str, request: Any) -> None:
+    """Precomputed POI tables return the same results as the search."""
+    plain = request.getfixturevalue(world)
+    tabled = World(poi_quantiles=[0.8])
+    tabled.add_waypoints(plain.waypoints)
+    tabled.add_trackpoints(plain.trackpoints)
+    assert list(tabled.fastest_path("alice", "bob").nodes) == list(
+        plain.fastest_path("alice", "bob").nodes
+    )
+    assert tabled.single_source_periods(
+        "alice"
+    ) == plain.single_source_periods("alice")
+    assert set(tabled.poi_tables) == {0.8}
+
+
+def test_poi_tables_rebuild(world1: World) -> None:
+    """POI tables are rebuilt together with the graph."""
+    world1.poi_quantiles = (0.5,)
+    world1.fastest_path("alice", "bob")
+    table = world1.poi_tables[0.5]
+    world1.add_waypoints([("carol", 49.0020, 8.4020)])
+    world1.fastest_path("alice", "bob")
+    assert world1.poi_tables[0.5] is not table
+    assert "carol" in world1.poi_tables[0.5].pois
+
+
+def test_contraction_same_path(world2: World) -> None:
+    """Contracted graph finds the same path through a slow intersection."""
+    world2.contraction_quantile = 0.8
+    result = world2.fastest_path("alice", "bob")
+    expected = ["alice", ("2", "alice", "2"), ("2", "2", "bob"), "bob"]
+    assert list(result.nodes) == expected
+    assert set(world2.contracted.core) == {"alice", "bob"}
+
+
+def test_route_distribution(world2: World) -> None:
+    """Simulated totals of a path are reproducible with a seed."""
+    path = world2.fastest_path("alice", "bob")
+    result = world2.route_distribution(path, samples=100, seed=0)
+    assert list(result.totals) == [56] * 100
+    assert result.quantiles == {0.5: 56, 0.8: 56}
+    assert result.bands == {0.5: (56, 56), 0.9: (56, 56)}
+    result_a, result_b = world2.route_distributions(
+        [path, ["alice"]], samples=10, seed=0
+    )
+    assert list(result_a.totals) == [56] * 10
+    assert list(result_b.totals) == [0] * 10
+
+
+def test_alternative_paths(world2: World) -> None:
+    """The only path is the fastest one."""
+    result = world2.alternative_paths("alice", "bob")
+    assert len(result) == 1
+    period, path = result[0]
+    assert period == 56
+    assert list(path.nodes) == list(world2.fastest_path("alice", "bob"))
+
+
+def test_background_rebuild_serves_old_graph(world1: World) -> None:
+    """Queries use the complete old graph while the new one is built."""
+    world1.background = True
+    world1.fastest_path("alice", "bob")
+    graph = world1.graph
+
+    started, release = threading.Event(), threading.Event()
+    build_snapshot = world1._build_snapshot
+
+    def slow_build_snapshot(*args: Any) -> Snapshot:
+        started.set()
+        release.wait(5)
+        return build_snapshot(*args)
+
+    world1._build_snapshot = slow_build_snapshot  # type: ignore
+    world1.add_waypoints([("carol", 49.0005, 8.4005)])
+    assert started.wait(5)
+    assert world1.graph is graph
+    assert list(world1.fastest_path("alice", "bob").nodes) == ["alice", "bob"]
+    release.set()
+    world1.wait_for_rebuild()
+    assert world1.graph is not graph
+    assert list(world1.fastest_path("alice", "bob").nodes) == [
+        "alice",
+        "carol",
+        "bob",
+    ]
+
+
+def test_background_first_build_waits(world1: World) -> None:
+    """Without any previous graph the query waits for the rebuild."""
+    world = World(background=True)
+    world.add_waypoints(world1.waypoints)
+    world.add_trackpoints(world1.trackpoints)
+    assert list(world.fastest_path("alice", "bob").nodes) == ["alice", "bob"]
+
+
+def test_background_rebuild_error_raised(world1: World) -> None:
+    """A failed rebuild is raised instead of serving the old graph."""
+    world1.background = True
+    world1.fastest_path("alice", "bob")
+    world1.add_trackpoints(
+        [(dt.datetime(2020, 5, 2, tzinfo=dt.timezone.utc), 49.0, 20.0)]
+    )
+    with pytest.raises(RegionTooLargeError):
+        world1.wait_for_rebuild()
+    with pytest.raises(RegionTooLargeError):
+        world1.single_source_periods("alice")
+
+
+def test_downsample_same_periods(world2: World) -> None:
+    """Exact downsampling does not change the periods."""
+    expected = world2.single_source_periods("alice")
+    world2.downsample = 0
+    world2.add_trackpoints([])
+    assert world2.single_source_periods("alice") == expected
+
+
+def test_interpolate_same_path(world2: World) -> None:
+    """Matching the lines finds the same route as the points."""
+    expected = list(world2.fastest_path("alice", "bob").nodes)
+    world2.interpolate = True
+    world2.add_trackpoints([])
+    assert list(world2.fastest_path("alice", "bob").nodes) == expected
+
+
+def test_quantile_sweep(world2: World) -> None:
+    """All quantiles share the only path."""
+    runs = world2.quantile_sweep("alice", "bob", [0.2, 0.5, 0.8])
+    assert len(runs) == 1
+    assert list(runs[0].quantiles) == [0.2, 0.5, 0.8]
+    assert list(runs[0].path.nodes) == list(
+        world2.fastest_path("alice", "bob").nodes
+    )
+    assert list(runs[0].periods) == [56, 56, 56]
+
+
+def _alice_to_bob(start: dt.datetime, secs: int) -> List[Tuple]:
+    """Create a track from alice to bob taking secs."""
+    return [
+        (start, 49.0001, 8.4001),
+        (start + dt.timedelta(seconds=secs // 2), 49.0005, 8.4005),
+        (start + dt.timedelta(seconds=secs), 49.0009, 8.4009),
+    ]
+
+
+def test_window_uses_recent_trackpoints_only() -> None:
+    """Trackpoints older than the window are left out of the graph."""
+    now = dt.datetime.now(dt.timezone.utc)
+    world = World(window=dt.timedelta(days=30))
+    world.add_waypoints([("alice", 49.0000, 8.4000), ("bob", 49.0010, 8.4010)])
+    world.add_trackpoints(_alice_to_bob(now - dt.timedelta(days=400), 60))
+    world.add_trackpoints(_alice_to_bob(now - dt.timedelta(days=10), 6))
+    assert world.graph is None
+    assert world.single_source_periods("alice") == {"alice": 0, "bob": 6}
+    assert world.graph.edges["alice", "bob"]["secs"] == [6]
+    assert len(world.trackpoints) == 6
+
+    # the recent batch is processed once, the old one never
+    cached = world._encounter_cache[1]
+    world.add_trackpoints(_alice_to_bob(now - dt.timedelta(days=5), 8))
+    assert world.graph is None
+    assert world.single_source_periods("alice") == {"alice": 0, "bob": 7}
+    assert world.graph.edges["alice", "bob"]["secs"] == [6, 8]
+    assert world._encounter_cache[1] is cached
+    assert set(world._encounter_cache) == {1, 2}
+    assert [batch.num for batch in world._batches] == [1, 2]
+
+    # the cached encounters leave with their batch
+    world.window = dt.timedelta(days=7)
+    world.add_trackpoints([])
+    assert world.single_source_periods("alice") == {"alice": 0, "bob": 8}
+    assert set(world._encounter_cache) == {2}
+    assert [batch.num for batch in world._batches] == [2]
+
+
+def test_window_naive_timestamps() -> None:
+    """Naive timestamps are considered UTC."""
+    now = dt.datetime.now(dt.timezone.utc).replace(tzinfo=None)
+    world = World(window=dt.timedelta(days=30))
+    world.add_waypoints([("alice", 49.0000, 8.4000), ("bob", 49.0010, 8.4010)])
+    old = _alice_to_bob(now - dt.timedelta(days=400), 60)
+    world.add_trackpoints(old + _alice_to_bob(now - dt.timedelta(days=10), 6))
+    world.add_trackpoints(_alice_to_bob(now - dt.timedelta(days=5), 8))
+    assert world.graph is None
+    assert world.single_source_periods("alice") == {"alice": 0, "bob": 7}
+
+
+def test_window_cuts_overlapping_batch() -> None:
+    """Only the recent part of a batch overlapping the window is used."""
+    now = dt.datetime.now(dt.timezone.utc)
+    world = World(window=dt.timedelta(days=30))
+    world.add_waypoints([("alice", 49.0000, 8.4000), ("bob", 49.0010, 8.4010)])
+    old = _alice_to_bob(now - dt.timedelta(days=400), 60)
+    world.add_trackpoints(old + _alice_to_bob(now - dt.timedelta(days=10), 6))
+    assert world.single_source_periods("alice") == {"alice": 0, "bob": 6}
+    assert world._encounter_cache == {}